@@ -0,0 +1,98 @@
+import gc
+import os
+from typing import Any, Callable, Dict, Optional
+
+# Agent settings shared by both handlers (and the retrieve tool), read once per container.
+
+# Optional Bedrock prompt caching: cache point type (e.g. "default") placed after the
+# static system prompt. Only enable for models that support prompt caching.
+CACHE_PROMPT = os.environ.get('CACHE_PROMPT')
+
+# Bedrock inference latency profile ("standard" or "optimized"). Latency-optimized
+# inference is only available for some models and regions.
+BEDROCK_LATENCY = os.environ.get('BEDROCK_LATENCY', 'standard')
+
+# Optional agent model override
+BEDROCK_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID')
+
+# Tool calls are I/O-bound, so let Strands run more of them concurrently than its default
+# of os.cpu_count() (1 or 2 on Lambda). Strands 1.x dropped max_parallel_tools, which is
+# why requirements.txt pins strands-agents below 1.
+MAX_PARALLEL_TOOLS = int(os.environ.get('MAX_PARALLEL_TOOLS', '8'))
+
+
+def build_model_config(default_model_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Return the BedrockModel keyword arguments for an agent.
+
+    The model is BEDROCK_MODEL_ID if set, otherwise default_model_id. Without either, no
+    model_id is passed and Strands uses its default model.
+    """
+    model_config: Dict[str, Any] = {}
+
+    model_id = BEDROCK_MODEL_ID or default_model_id
+    if model_id:
+        model_config["model_id"] = model_id
+
+    if CACHE_PROMPT:
+        model_config["cache_prompt"] = CACHE_PROMPT
+
+    if BEDROCK_LATENCY != "standard":
+        model_config["additional_args"] = {"performanceConfig": {"latency": BEDROCK_LATENCY}}
+
+    return model_config
+
+
+def reset_agent(agent: Any) -> None:
+    """
+    Drop the per-invocation state of a shared agent.
+
+    Besides the conversation, Strands appends a trace (holding the model and tool-result
+    messages) and a cycle duration to the agent's event loop metrics on every call, so
+    those are replaced too.
+    """
+    from strands.telemetry.metrics import EventLoopMetrics
+
+    agent.messages.clear()
+    agent.event_loop_metrics = EventLoopMetrics()
+
+
+def warm_up(get_agent: Callable[[], Any]) -> None:
+    """
+    Build the agent during the Lambda INIT phase so the first request doesn't pay for it.
+
+    If WARMUP_PROMPT is set, it is also sent through the agent once to load the remaining
+    lazy imports and open the Bedrock connection. This costs one model call per cold start.
+    """
+    try:
+        agent = get_agent()
+    except Exception as e:
+        # Don't fail the INIT phase: the handler retries the build and returns the error as a 500
+        print(f"Agent initialization failed: {e}")
+        return
+
+    warmup_prompt = os.environ.get('WARMUP_PROMPT')
+    if warmup_prompt:
+        try:
+            agent(warmup_prompt)
+        except Exception as e:
+            print(f"Warmup prompt failed: {e}")
+        finally:
+            reset_agent(agent)
+
+
+def initialize_container(get_agent: Optional[Callable[[], Any]]) -> None:
+    """
+    Finish a handler module's INIT phase: warm up its agent (if it has one) and freeze the
+    objects allocated so far.
+    """
+    # Set LAMBDA_WARMUP=0 to build the agent on the first request instead
+    if get_agent is not None and os.environ.get('LAMBDA_WARMUP', '1') == '1':
+        warm_up(get_agent)
+
+    # Move everything allocated during INIT (modules, clients, the agent) out of the collected
+    # generations so garbage collections during requests don't keep re-scanning it. Collect
+    # first: frozen objects are never freed, so INIT garbage (e.g. the warmup conversation)
+    # must not be frozen with them.
+    gc.collect()
+    gc.freeze()
@@ -1,7 +1,14 @@
-from strands import Agent
-from strands_tools import http_request
+from functools import lru_cache
 from typing import Dict, Any
-import json
+
+# orjson-backed JSON helpers
+from serialization import dumps, loads, proxy_response
+
+# Shared keep-alive/retry configuration for Bedrock clients
+from clients import BEDROCK_CLIENT_CONFIG
+
+# Agent settings and INIT-phase warmup shared with the encyclopedia handler
+from agent_config import MAX_PARALLEL_TOOLS, build_model_config, initialize_container, reset_agent
 
 # Define a weather-focused system prompt
 WEATHER_SYSTEM_PROMPT = """You are a weather assistant with HTTP capabilities. You can:
@@ -23,40 +30,79 @@ When displaying responses:
 Always explain the weather conditions clearly and provide context for the forecast.
 """
 
+# Static API Gateway response headers, built once per container
+RESPONSE_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+# Start of every successful response body, up to the serialized answer string
+_OK_BODY_PREFIX = '{"response":'
+
+# The weather agent drives multi-step HTTP tool use, so it keeps the Strands default model
+# unless BEDROCK_MODEL_ID is set
+model_config = build_model_config()
+
+@lru_cache(maxsize=None)
+def get_weather_agent():
+    """
+    Build the weather agent on first use and reuse it for the container's lifetime.
+
+    Strands, the Bedrock model and the http_request tool are imported here so
+    importing the handler stays cheap.
+    """
+    from strands import Agent
+    from strands.models import BedrockModel
+    from strands_tools import http_request
+    
+    return Agent(
+        model=BedrockModel(boto_client_config=BEDROCK_CLIENT_CONFIG, **model_config),
+        system_prompt=WEATHER_SYSTEM_PROMPT,
+        tools=[http_request],
+        max_parallel_tools=MAX_PARALLEL_TOOLS,
+        # The default handler prints every streamed token and tool call to the Lambda logs
+        callback_handler=None,
+    )
+
+# Build the agent during INIT (see LAMBDA_WARMUP) and freeze INIT-time objects
+initialize_container(get_weather_agent)
+
 def handler(event: Dict[str, Any], _context) -> Dict[str, Any]:
+    # Scheduled warmup pings only need the initialized container, not an agent run
+    if event.get('warmup'):
+        return proxy_response(200, {'warmup': True}, RESPONSE_HEADERS)
+    
     try:
         # Parse the request body from API Gateway
         if 'body' in event:
-            body = json.loads(event['body'])
-            prompt = body.get('prompt')
+            try:
+                body = loads(event['body'] or '{}')
+            except ValueError as e:
+                # Both orjson and json decode errors subclass ValueError
+                return proxy_response(400, {'error': f'Error parsing request: {str(e)}'}, RESPONSE_HEADERS)
+            prompt = body.get('prompt') if isinstance(body, dict) else None
         else:
             # Direct Lambda invocation
             prompt = event.get('prompt')
         
         if not prompt:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'error': 'Missing prompt parameter'})
-            }
+            return proxy_response(400, {'error': 'Missing prompt parameter'}, RESPONSE_HEADERS)
         
-        weather_agent = Agent(
-            system_prompt=WEATHER_SYSTEM_PROMPT,
-            tools=[http_request],
-        )
-
-        response = weather_agent(prompt)
+        weather_agent = get_weather_agent()
+        
+        # The agent's conversation and metrics are scoped to this invocation: they are reset
+        # even if the agent raises, so no state leaks into the next invocation
+        try:
+            response = weather_agent(prompt)
+        finally:
+            reset_agent(weather_agent)
         
+        # Only the answer string needs serializing; the envelope is a fixed template
         return {
             'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'response': str(response)})
+            'headers': RESPONSE_HEADERS,
+            'body': _OK_BODY_PREFIX + dumps(str(response)) + '}'
         }
         
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'body': json.dumps({'error': str(e)})
-        }
\ No newline at end of file
+        return proxy_response(500, {'error': str(e)}, RESPONSE_HEADERS)
\ No newline at end of file
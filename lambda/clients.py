@@ -0,0 +1,23 @@
+import boto3
+from functools import lru_cache
+
+from botocore.config import Config
+
+# Shared client configuration: keep connections alive and pooled across warm invocations,
+# back off adaptively under Bedrock throttling, and bound how long a socket can hang.
+# The read timeout stays below the 30 second Lambda timeout.
+BEDROCK_CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    retries={"mode": "adaptive", "max_attempts": 5},
+    tcp_keepalive=True,
+    connect_timeout=2,
+    read_timeout=25,
+)
+
+
+@lru_cache(maxsize=None)
+def get_agent_runtime_client(region: str):
+    """
+    Return the bedrock-agent-runtime client for a region, creating it once per container.
+    """
+    return boto3.client("bedrock-agent-runtime", region_name=region, config=BEDROCK_CLIENT_CONFIG)
@@ -1,201 +1,481 @@
 import os
-import boto3
-import json
+import hashlib
 import logging
-from typing import Dict, Any, List
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 
 # Correct imports for tool definition
 from strands import tool
 
-# Set up logging
+from agent_config import BEDROCK_LATENCY
+from cache import CACHE_TTL_SECONDS, TTLCache
+from clients import get_agent_runtime_client
+from serialization import dumps
+
+# Set up logging. Per-call retrieval details are logged at DEBUG; set LOG_LEVEL=DEBUG to see them
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+if isinstance(logging.getLevelName(LOG_LEVEL), int):
+    logger.setLevel(LOG_LEVEL)
+else:
+    # An unknown level would raise here and fail INIT, so keep INFO instead
+    logger.setLevel(logging.INFO)
+    logger.warning("Ignoring invalid LOG_LEVEL %r; using INFO", LOG_LEVEL)
+
+# Set DEBUG_RAW_RESPONSE=1 to log the full retrieve_and_generate response
+DEBUG_RAW_RESPONSE = os.getenv("DEBUG_RAW_RESPONSE") == "1"
+
+# Container-level configuration, read once at import time
+DEFAULT_KNOWLEDGE_BASE_ID = os.getenv("KNOWLEDGE_BASE_ID")
+MODEL_ID = os.getenv("MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
+
+# Default number of knowledge base results. Generation time grows with the amount of
+# retrieved context, so keep this small unless answers need more sources.
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "5"))
+
+# How custom_retrieve queries the knowledge base: "generate" (retrieve_and_generate) or
+# "retrieve", which returns the passages without a knowledge base generation step so only
+# the agent's model writes the answer. Retrieve has no Bedrock RAG sessions.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "generate")
+
+# Warm-container cache of session-less retrievals, keyed by knowledge base, result count,
+# region and a hash of the query text. Cache hits carry no sessionId, so it is opt-in: set
+# RETRIEVAL_CACHE_SIZE to enable it (CACHE_TTL_SECONDS=0 also disables it).
+_RETRIEVAL_CACHE = TTLCache(
+    maxsize=int(os.getenv("RETRIEVAL_CACHE_SIZE", "0")),
+    ttl=CACHE_TTL_SECONDS,
+)
+
+# Bedrock RAG session of the request being processed. Lambda handles one event per
+# execution environment at a time, so the handler sets this before running the agent.
+_active_session_id: Optional[str] = None
+
+# Futures of the uncached retrievals currently in flight, by cache key
+_inflight_lock = threading.Lock()
+_inflight_retrievals: Dict[Tuple, Future] = {}
+
+
+@lru_cache(maxsize=8)
+def _model_arn(region: str) -> str:
+    """
+    Return the foundation model ARN used for generation in a region.
+    """
+    return f"arn:aws:bedrock:{region}::foundation-model/{MODEL_ID}"
+
+
+def set_session_id(session_id: Optional[str]) -> None:
+    """
+    Set the Bedrock RAG session used by custom_retrieve for the current request.
+    """
+    global _active_session_id
+    _active_session_id = session_id
+
+
+def _retrieval_result(answer_text: str, citations: List[Dict[str, Any]], session_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Build the custom_retrieve tool result. The citations and sessionId travel alongside the
+    answer so the handler can read them back from the agent's messages.
+    """
+    return {
+        "status": "success",
+        "content": [
+            {"text": answer_text},
+            {"json": {"citations": citations, "sessionId": session_id}},
+        ],
+    }
+
+
+def _iter_references(response: Dict[str, Any]) -> Iterator[Tuple[Optional[Dict[str, Any]], Dict[str, Any]]]:
+    """
+    Yield (span, reference) pairs for every retrieved reference in a retrieve_and_generate response.
+    """
+    for citation_group in response.get("citations", []):
+        span = citation_group.get("generatedResponsePart", {}).get("textResponsePart", {}).get("span")
+        for ref in citation_group.get("retrievedReferences", []):
+            yield span, ref
+
+
+def _reference_key(span: Optional[Dict[str, Any]], ref: Dict[str, Any]) -> Tuple:
+    """
+    Return the deduplication key of a retrieved reference.
+    """
+    return (
+        ref.get("metadata", {}).get("x-amz-bedrock-kb-chunk-id"),
+        ref.get("location", {}).get("s3Location", {}).get("uri", "Unknown"),
+        (span.get("start"), span.get("end")) if span else None,
+    )
+
+
+def _build_citation(index: int, span: Optional[Dict[str, Any]], ref: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the citation dict returned to the handler for a retrieved reference.
+    """
+    return {
+        "id": f"doc-{index}",
+        "source": ref.get("location", {}).get("s3Location", {}).get("uri", "Unknown"),
+        "content": _snippet(ref.get("content", {}).get("text", "")),
+        "metadata": ref.get("metadata", {}),
+        "span": span,  # Include span information
+    }
+
+
+def text_hash(text: str) -> str:
+    """
+    Return a compact, fixed-size cache key for a query or prompt text.
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def copy_citations(citations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Return a private copy of citation dicts for storing in or returning from a cache, so
+    changes to the citations handed to callers don't leak into the cached entry.
+    """
+    return [dict(citation) for citation in citations]
+
+
+def _snippet(text: str, limit: int = 500) -> str:
+    """
+    Truncate text to a citation snippet, only appending an ellipsis when it was cut.
+    """
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+@lru_cache(maxsize=32)
+def _generation_configuration(kb_id: str, region: str, number_of_results: int, guardrail_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Build the retrieveAndGenerateConfiguration for a knowledge base once and reuse it.
+
+    The returned dict is shared between calls, so it must not be modified.
+    """
+    configuration = {
+        "type": "KNOWLEDGE_BASE",
+        "knowledgeBaseConfiguration": {
+            "knowledgeBaseId": kb_id,
+            "modelArn": _model_arn(region),
+            "retrievalConfiguration": {
+                "vectorSearchConfiguration": {
+                    "numberOfResults": number_of_results
+                }
+            },
+            "generationConfiguration": {
+                "inferenceConfig": {
+                    "textInferenceConfig": {
+                        "maxTokens": 4096,
+                        "temperature": 0.0,
+                        "topP": 0.5
+                    }
+                }
+            }
+        }
+    }
+    
+    generation_configuration = configuration["knowledgeBaseConfiguration"]["generationConfiguration"]
+    
+    # Opt in to latency-optimized generation when configured
+    if BEDROCK_LATENCY != "standard":
+        generation_configuration["performanceConfig"] = {"latency": BEDROCK_LATENCY}
+    
+    # Apply the guardrail here when no agent model sits in front of this call
+    if guardrail_id:
+        generation_configuration["guardrailConfiguration"] = {
+            "guardrailId": guardrail_id,
+            "guardrailVersion": "DRAFT",
+        }
+    
+    return configuration
+
+
+def _retrieve_and_generate(
+    text: str,
+    number_of_results: int,
+    kb_id: str,
+    region: str,
+    session_id: Optional[str],
+    guardrail_id: Optional[str],
+) -> Tuple[str, List[Dict[str, Any]], Optional[str]]:
+    """
+    Call retrieve_and_generate and deduplicate the returned citations, bypassing the cache.
+    """
+    model_arn = _model_arn(region)
+    
+    logger.debug("[custom_retrieve] Using knowledge base ID: %s", kb_id)
+    logger.debug("[custom_retrieve] Using model ARN: %s", model_arn)
+    
+    # Reuse the pooled Bedrock client for this region
+    bedrock_runtime = get_agent_runtime_client(region)
+
+    # Prepare retrieve_and_generate parameters around the prebuilt configuration
+    retrieve_params = {
+        "input": {"text": text},
+        "retrieveAndGenerateConfiguration": _generation_configuration(kb_id, region, number_of_results, guardrail_id),
+    }
+    
+    # Add sessionId if provided
+    if session_id:
+        retrieve_params["sessionId"] = session_id
+        logger.debug("[custom_retrieve] Using sessionId: %s", session_id)
+
+    # Use retrieve_and_generate to get citations
+    started = time.perf_counter()
+    response = bedrock_runtime.retrieve_and_generate(**retrieve_params)
+    logger.info("[custom_retrieve] retrieve_and_generate took %.0f ms", (time.perf_counter() - started) * 1000)
+    
+    # Log the full response structure
+    logger.debug("[custom_retrieve] Full response keys: %s", response.keys())
+    
+    # Serializing the raw response is expensive, so only dump it when explicitly requested
+    if DEBUG_RAW_RESPONSE:
+        logger.info("[custom_retrieve] Raw retrieve_and_generate response: %s", dumps(response, default=str))
+    
+    if "citations" in response:
+        logger.debug("[custom_retrieve] Found %d citation groups", len(response["citations"]))
+    
+    # Deduplicate references by (chunk_id, source, span) before building any citation.
+    # The dict keeps the first occurrence of each key in response order.
+    unique_references = {}
+    kept_chunks = set()
+    reference_count = 0
+    for span, ref in _iter_references(response):
+        reference_count += 1
+        key = _reference_key(span, ref)
+        
+        # Keep at most number_of_results distinct chunks, but every span that cites a kept
+        # chunk, so later sentences keep their highlights and sources
+        chunk = key[:2]
+        if chunk not in kept_chunks:
+            if len(kept_chunks) >= number_of_results:
+                continue
+            kept_chunks.add(chunk)
+        
+        unique_references.setdefault(key, (span, ref))
+    
+    deduplicated_citations = [
+        _build_citation(index, span, ref)
+        for index, (span, ref) in enumerate(unique_references.values(), 1)
+    ]
+    
+    logger.debug("[custom_retrieve] Deduplicated from %d to %d citations", reference_count, len(deduplicated_citations))
+    
+    # Get the answer text
+    answer_text = response.get("output", {}).get("text", "No relevant information found.")
+    
+    return answer_text, deduplicated_citations, response.get("sessionId")
+
+
+def _retrieve(text: str, number_of_results: int, kb_id: str, region: str) -> Tuple[str, List[Dict[str, Any]], Optional[str]]:
+    """
+    Call retrieve and deduplicate the returned passages, bypassing the cache.
+    """
+    logger.debug("[custom_retrieve] Using knowledge base ID: %s", kb_id)
+    
+    bedrock_runtime = get_agent_runtime_client(region)
+    
+    started = time.perf_counter()
+    response = bedrock_runtime.retrieve(
+        knowledgeBaseId=kb_id,
+        retrievalQuery={"text": text},
+        retrievalConfiguration={"vectorSearchConfiguration": {"numberOfResults": number_of_results}},
+    )
+    logger.info("[custom_retrieve] retrieve took %.0f ms", (time.perf_counter() - started) * 1000)
+    
+    # Retrieval results carry the same content/location/metadata fields as
+    # retrieve_and_generate references, just without a span
+    unique_results = {}
+    for result in response.get("retrievalResults", []):
+        unique_results.setdefault(_reference_key(None, result), result)
+    
+    results = list(unique_results.values())[:number_of_results]
+    citations = [_build_citation(index, None, result) for index, result in enumerate(results, 1)]
+    
+    # The agent's model writes the answer, so it gets the full passage text, not the snippets
+    passages = "\n\n".join(
+        f"Source: {citation['source']}\n{result.get('content', {}).get('text', '')}"
+        for citation, result in zip(citations, results)
+    )
+    
+    return passages or "No relevant information found.", citations, None
+
+
+def _cached_retrieval(
+    cache_key: Tuple,
+    fetch: Callable[[], Tuple[str, List[Dict[str, Any]], Optional[str]]],
+) -> Tuple[str, List[Dict[str, Any]], Optional[str]]:
+    """
+    Return the cached (text, citations, None) for cache_key, or call fetch and cache its
+    (text, citations, sessionId) result. Cache hits return no sessionId so callers never
+    share a Bedrock session.
+    """
+    if not _RETRIEVAL_CACHE.enabled:
+        return fetch()
+    
+    # Parallel tool calls often repeat a sub-query. The first caller fetches; identical
+    # queries arriving while it is in flight share its result (or exception).
+    with _inflight_lock:
+        cached = _RETRIEVAL_CACHE.get(cache_key)
+        future = _inflight_retrievals.get(cache_key)
+        is_leader = cached is None and future is None
+        if is_leader:
+            future = _inflight_retrievals[cache_key] = Future()
+    
+    if is_leader:
+        try:
+            answer_text, citations, new_session_id = fetch()
+            cached = (answer_text, copy_citations(citations))
+            _RETRIEVAL_CACHE.set(cache_key, cached)
+            future.set_result(cached)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with _inflight_lock:
+                del _inflight_retrievals[cache_key]
+        
+        return answer_text, citations, new_session_id
+    
+    if cached is None:
+        cached = future.result()
+    
+    logger.debug("[custom_retrieve] Returning cached retrieval result")
+    answer_text, cached_citations = cached
+    return answer_text, copy_citations(cached_citations), None
+
+
+def retrieve_and_generate_answer(
+    text: str,
+    number_of_results: int = RAG_TOP_K,
+    knowledge_base_id: Optional[str] = None,
+    region: str = "us-west-2",
+    session_id: Optional[str] = None,
+    guardrail_id: Optional[str] = None,
+) -> Tuple[str, List[Dict[str, Any]], Optional[str]]:
+    """
+    Answer a query with a single Bedrock retrieve_and_generate call.
+    
+    Args:
+        text: The query to retrieve relevant knowledge.
+        number_of_results: The maximum number of results to return. Default is RAG_TOP_K (5).
+        knowledge_base_id: The ID of the knowledge base to retrieve from.
+        region: The AWS region name. Default is 'us-west-2'.
+        session_id: Bedrock RAG session to continue, if any.
+        guardrail_id: Guardrail applied to generation (DRAFT version), if any.
+    
+    Returns:
+        tuple: The generated answer, the deduplicated citations and the Bedrock sessionId.
+    """
+    # Get default knowledge base ID if not provided
+    kb_id = knowledge_base_id if knowledge_base_id else DEFAULT_KNOWLEDGE_BASE_ID
+    
+    # Follow-up questions depend on the session's conversation, so only session-less
+    # retrievals are cached
+    if session_id:
+        return _retrieve_and_generate(text, number_of_results, kb_id, region, session_id, guardrail_id)
+    
+    cache_key = ("generate", kb_id, number_of_results, region, guardrail_id, text_hash(text))
+    return _cached_retrieval(
+        cache_key,
+        lambda: _retrieve_and_generate(text, number_of_results, kb_id, region, None, guardrail_id),
+    )
+
+
+def retrieve_passages(
+    text: str,
+    number_of_results: int = RAG_TOP_K,
+    knowledge_base_id: Optional[str] = None,
+    region: str = "us-west-2",
+) -> Tuple[str, List[Dict[str, Any]], Optional[str]]:
+    """
+    Fetch the top knowledge base passages for a query with a Bedrock retrieve call, without
+    generating an answer. Retrieve has no RAG sessions, so the sessionId is always None.
+    
+    Args:
+        text: The query to retrieve relevant knowledge.
+        number_of_results: The maximum number of results to return. Default is RAG_TOP_K (5).
+        knowledge_base_id: The ID of the knowledge base to retrieve from.
+        region: The AWS region name. Default is 'us-west-2'.
+    
+    Returns:
+        tuple: The passages formatted for the agent, the deduplicated citations and None.
+    """
+    kb_id = knowledge_base_id if knowledge_base_id else DEFAULT_KNOWLEDGE_BASE_ID
+    cache_key = ("retrieve", kb_id, number_of_results, region, text_hash(text))
+    return _cached_retrieval(cache_key, lambda: _retrieve(text, number_of_results, kb_id, region))
+
 
 @tool
-def custom_retrieve(text: str, numberOfResults: int = 10, knowledgeBaseId: str = None, region: str = "us-west-2"):
+def custom_retrieve(text: str, numberOfResults: int = RAG_TOP_K, knowledgeBaseId: str = None, region: str = "us-west-2"):
     """
     Custom retrieve tool that logs raw results and includes citations.
     
     Args:
         text: The query to retrieve relevant knowledge.
-        numberOfResults: The maximum number of results to return. Default is 10.
+        numberOfResults: The maximum number of results to return. Default is RAG_TOP_K (5).
         knowledgeBaseId: The ID of the knowledge base to retrieve from.
         region: The AWS region name. Default is 'us-west-2'.
     
     Returns:
-        str: Retrieved results with citations.
+        dict: Tool result with the generated answer (or, with RETRIEVAL_MODE=retrieve, the
+        retrieved passages) as text and a JSON block holding the deduplicated citations
+        and the Bedrock sessionId.
     """
     try:
-        # Get default knowledge base ID if not provided
-        default_knowledge_base_id = os.getenv("KNOWLEDGE_BASE_ID")
-        kb_id = knowledgeBaseId if knowledgeBaseId else default_knowledge_base_id
-        model_id = os.getenv("MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
-        model_arn = f"arn:aws:bedrock:{region}::foundation-model/{model_id}"
-        
-        # Get sessionId if provided
-        session_id = os.getenv("SESSION_ID")
-        
-        logger.info(f"[custom_retrieve] Using knowledge base ID: {kb_id}")
-        logger.info(f"[custom_retrieve] Using model ARN: {model_arn}")
-        
-        # Initialize Bedrock client
-        bedrock_runtime = boto3.client("bedrock-agent-runtime", region_name=region)
-
-        # Prepare retrieve_and_generate parameters
-        retrieve_params = {
-            "input": {"text": text},
-            "retrieveAndGenerateConfiguration": {
-                "type": "KNOWLEDGE_BASE",
-                "knowledgeBaseConfiguration": {
-                    "knowledgeBaseId": kb_id,
-                    "modelArn": model_arn,
-                    "retrievalConfiguration": {
-                        "vectorSearchConfiguration": {
-                            "numberOfResults": numberOfResults
-                        }
-                    },
-                    "generationConfiguration": {
-                        "inferenceConfig": {
-                            "textInferenceConfig": {
-                                "maxTokens": 4096,
-                                "temperature": 0.0,
-                                "topP": 0.5
-                            }
-                        }
-                    }
-                }
-            }
-        }
-        
-        # Add sessionId if provided
-        if session_id:
-            retrieve_params["sessionId"] = session_id
-            logger.info(f"[custom_retrieve] Using sessionId: {session_id}")
-
-        # Use retrieve_and_generate to get citations
-        response = bedrock_runtime.retrieve_and_generate(**retrieve_params)
-        
-        # Log the full response structure
-        logger.info(f"[custom_retrieve] Full response keys: {list(response.keys())}")
-        
-        # Log the raw response
-        print(f"Raw retrieve_and_generate response: {json.dumps(response, default=str)}")
-        
-        # Extract citations from the response
-        citations = []
-        citation_groups_by_span = {}
-        
-        if "citations" in response:
-            logger.info(f"[custom_retrieve] Found {len(response['citations'])} citation groups")
-            
-            # First pass: organize citation groups by span to detect duplicates
-            for i, citation_group in enumerate(response.get("citations", [])):
-                # Extract span information if available
-                span = None
-                if "generatedResponsePart" in citation_group and "textResponsePart" in citation_group["generatedResponsePart"]:
-                    span_data = citation_group["generatedResponsePart"]["textResponsePart"].get("span")
-                    if span_data:
-                        # Create a span key for deduplication
-                        span_key = f"{span_data.get('start')}:{span_data.get('end')}"
-                        if span_key not in citation_groups_by_span:
-                            citation_groups_by_span[span_key] = []
-                        citation_groups_by_span[span_key].append((i, citation_group))
-                        span = span_data
-                
-                if "retrievedReferences" in citation_group:
-                    for ref in citation_group.get("retrievedReferences", []):
-                        citation = {
-                            "id": f"doc-{len(citations)+1}",
-                            "source": ref.get("location", {}).get("s3Location", {}).get("uri", "Unknown"),
-                            "content": ref.get("content", {}).get("text", "")[:500] + "...",
-                            "metadata": ref.get("metadata", {}),
-                            "span": span,  # Include span information
-                            "group_index": i  # Track which group this came from
-                        }
-                        citations.append(citation)
-        
-        logger.info(f"[custom_retrieve] Extracted {len(citations)} citations")
-        
-        # Advanced deduplication based on multiple factors
-        deduplicated_citations = []
-        seen_keys = set()
-        
-        # Sort citations by group_index to maintain order
-        citations.sort(key=lambda c: c.get("group_index", 0))
-        
-        for citation in citations:
-            chunk_id = citation.get("metadata", {}).get("x-amz-bedrock-kb-chunk-id")
-            source = citation.get("source", "")
-            span_data = citation.get("span", {})
-            span_key = "none"
-            if span_data:
-                span_key = f"{span_data.get('start')}:{span_data.get('end')}"
-            
-            # Create a composite key for deduplication
-            dedup_key = f"{chunk_id}:{source}:{span_key}"
-            
-            # Skip if we've seen this exact combination before
-            if dedup_key in seen_keys:
-                continue
-            
-            seen_keys.add(dedup_key)
-            
-            # Remove the temporary group_index field before adding to final results
-            if "group_index" in citation:
-                del citation["group_index"]
-                
-            deduplicated_citations.append(citation)
-        
-        logger.info(f"[custom_retrieve] Deduplicated from {len(citations)} to {len(deduplicated_citations)} citations")
-        
-        logger.info(f"[custom_retrieve] Deduplicated from {len(citations)} to {len(deduplicated_citations)} citations")
-        
-        # Store deduplicated citations and sessionId for later retrieval
-        custom_retrieve.last_citations = deduplicated_citations
-        custom_retrieve.last_session_id = response.get("sessionId")
-        
-        # Get the answer text
-        answer_text = response.get("output", {}).get("text", "No relevant information found.")
-        
-        # Format the answer with citations
-        formatted_result = format_answer_with_citations(answer_text, citations)
-        
-        return formatted_result
+        if RETRIEVAL_MODE == "retrieve":
+            answer_text, citations, session_id = retrieve_passages(
+                text,
+                number_of_results=numberOfResults,
+                knowledge_base_id=knowledgeBaseId,
+                region=region,
+            )
+        else:
+            answer_text, citations, session_id = retrieve_and_generate_answer(
+                text,
+                number_of_results=numberOfResults,
+                knowledge_base_id=knowledgeBaseId,
+                region=region,
+                session_id=_active_session_id,
+            )
+        return _retrieval_result(answer_text, citations, session_id)
 
     except Exception as e:
-        logger.error(f"[custom_retrieve] Error: {str(e)}")
-        return f"Error during retrieval: {str(e)}"
+        logger.error("[custom_retrieve] Error: %s", e)
+        # Mark the result as failed so the handler doesn't cache an answer built on it
+        return {
+            "status": "error",
+            "content": [{"text": f"Error during retrieval: {str(e)}"}],
+        }
 
-def format_answer_with_citations(answer_text: str, citations: List[Dict[str, Any]]) -> str:
+
+def extract_retrieval_results(messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[str], bool]:
     """
-    Format the answer with citations for display.
+    Collect the citations and latest sessionId returned by custom_retrieve calls in an agent
+    conversation, and whether any tool call in it failed.
     """
-    if not citations:
-        return answer_text
+    citations = []
+    session_id = None
+    citation_count = 0
+    failed = False
     
-    # Add citation section
-    citation_text = "\n\nCitations:\n"
-    for i, citation in enumerate(citations):
-        doc_id = citation.get("id", f"doc-{i+1}")
-        location_info = citation.get("location", {})
-        
-        # Try to get a meaningful document identifier
-        doc_name = "Unknown"
-        if "s3Location" in location_info:
-            doc_name = location_info["s3Location"].get("uri", "Unknown")
-        elif "customDocumentLocation" in location_info:
-            doc_name = location_info["customDocumentLocation"].get("id", "Unknown")
+    for message in messages:
+        for block in message.get("content", []):
+            tool_result = block.get("toolResult", {})
+            if tool_result.get("status") == "error":
+                failed = True
             
-        citation_text += f"[{i+1}] Document: {doc_name}\n"
-        
-        # Add snippet if available
-        if "content" in citation:
-            citation_text += f"    Snippet: {citation['content']}\n"
+            for item in tool_result.get("content", []):
+                result = item.get("json")
+                if not result or "citations" not in result:
+                    continue
+                
+                # Renumber so ids stay unique across multiple tool calls
+                for citation in result["citations"]:
+                    citation_count += 1
+                    citation["id"] = f"doc-{citation_count}"
+                    citations.append(citation)
+                
+                session_id = result.get("sessionId") or session_id
     
-    return answer_text + citation_text
-
-
-# Initialize storage for citations and sessionId after function definition
-custom_retrieve.last_citations = []
-custom_retrieve.last_session_id = None
\ No newline at end of file
+    return citations, session_id, failed
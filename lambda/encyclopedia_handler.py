@@ -1,14 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import takewhile
+from typing import Callable, Dict, Any, Optional
+import os
+import threading
+import time
+
+from pydantic import ValidationError
 from strands import Agent
 from strands.models import BedrockModel
-from typing import Dict, Any
-import json
-import os
+
+# orjson-backed JSON helpers
+from serialization import proxy_response
+
+# Size-bounded TTL cache shared across warm invocations
+from cache import CACHE_TTL_SECONDS, TTLCache
+
+# Shared keep-alive/retry configuration for Bedrock clients
+from clients import BEDROCK_CLIENT_CONFIG
+
+# Agent settings and INIT-phase warmup shared with the weather handler
+from agent_config import MAX_PARALLEL_TOOLS, build_model_config, initialize_container, reset_agent
 
 # Import custom retrieve tool
-from custom_tools import custom_retrieve
+from custom_tools import (
+    copy_citations,
+    custom_retrieve,
+    extract_retrieval_results,
+    retrieve_and_generate_answer,
+    set_session_id,
+    text_hash,
+)
 
-# Import Pydantic models
-from models import EncyclopediaRequest, EncyclopediaResponse, Citation, Span
+# Import request model (validated with Pydantic) and the plain-dict response types
+from models import EncyclopediaRequest, EncyclopediaResponse
 
 # Define encyclopedia system prompt
 ENCYCLOPEDIA_SYSTEM_PROMPT = """You are an encyclopedia assistant with access to a knowledge base.
@@ -17,138 +42,249 @@ Provide detailed, educational responses based on the information in the knowledg
 If the knowledge base doesn't have the information, clearly state that you don't know.
 """
 
-def handler(event: Dict[str, Any], _context) -> Dict[str, Any]:
+# Static API Gateway response headers, built once per container
+RESPONSE_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS'
+}
+
+# Get knowledge base ID from environment (read once per container)
+knowledge_base_id = os.environ.get('KNOWLEDGE_BASE_ID')
+
+# Get guardrail ID from environment (optional)
+guardrail_id = os.environ.get('GUARDRAIL_ID')
+
+# Agent model. Claude 3 Haiku is the fastest option for knowledge base Q&A; set
+# BEDROCK_MODEL_ID to a larger model (e.g. Claude 3 Sonnet) for harder questions.
+model_config = build_model_config('anthropic.claude-3-haiku-20240307-v1:0')
+
+# Generation time grows with output length, so cap it (GEN_MAX_TOKENS) and keep sampling
+# close to deterministic (GEN_TEMPERATURE). Only the encyclopedia model is limited: the
+# weather agent writes multi-day forecasts and tool calls that must not be cut off.
+model_config.update(
+    max_tokens=int(os.environ.get('GEN_MAX_TOKENS', '512')),
+    temperature=float(os.environ.get('GEN_TEMPERATURE', '0.2')),
+)
+
+# Create model with guardrail if available
+if guardrail_id:
+    model_config.update(
+        guardrail_id=guardrail_id,
+        guardrail_version="DRAFT",  # or "LATEST" for deployed version
+        guardrail_trace="enabled"  # Enable trace info for debugging
+    )
+
+# Set DIRECT_RETRIEVAL=1 to answer each prompt with one retrieve_and_generate call instead
+# of an agent turn. This skips the extra model round-trips of the agent's tool loop, but
+# answers come from the knowledge base's generation prompt rather than the system prompt.
+direct_retrieval = os.environ.get('DIRECT_RETRIEVAL') == '1'
+
+# Number of batched prompts answered concurrently (when the batch has no sessionId)
+batch_concurrency = int(os.environ.get('BATCH_CONCURRENCY', '4'))
+
+# Time kept in reserve for one batched prompt: no further prompt is started once less than
+# this is left before the Lambda timeout, so the batch returns what it has instead of a 504
+batch_prompt_budget_ms = int(os.environ.get('BATCH_PROMPT_BUDGET_MS', '8000'))
+
+# Warm-container cache of complete session-less agent answers, keyed by knowledge base and
+# a hash of the prompt. Cache hits carry no sessionId, so it is opt-in: set
+# RESPONSE_CACHE_SIZE to enable it (CACHE_TTL_SECONDS=0 also disables it).
+_response_cache = TTLCache(
+    maxsize=int(os.environ.get('RESPONSE_CACHE_SIZE', '0')),
+    ttl=CACHE_TTL_SECONDS,
+)
+
+@lru_cache(maxsize=None)
+def get_bedrock_model():
+    """
+    Build the Bedrock model once per container; it is shared by every agent.
+    """
+    return BedrockModel(boto_client_config=BEDROCK_CLIENT_CONFIG, **model_config)
+
+def build_encyclopedia_agent():
+    """
+    Create an encyclopedia agent. Agents keep conversation state, so each thread needs its own.
+    """
+    # Create encyclopedia agent with custom retrieve tool and guardrailed model
+    return Agent(
+        model=get_bedrock_model(),
+        system_prompt=ENCYCLOPEDIA_SYSTEM_PROMPT,
+        tools=[custom_retrieve],
+        max_parallel_tools=MAX_PARALLEL_TOOLS,
+        # The default handler prints every streamed token and tool call to the Lambda logs
+        callback_handler=None,
+    )
+
+@lru_cache(maxsize=None)
+def get_encyclopedia_agent():
+    """
+    Build the encyclopedia agent on first use and reuse it for the container's lifetime.
+    """
+    return build_encyclopedia_agent()
+
+# Worker threads for batched prompts. Each thread lazily builds its own agent and keeps
+# it across warm invocations.
+_batch_executor = ThreadPoolExecutor(max_workers=batch_concurrency)
+_batch_agents = threading.local()
+
+def _answer_batch_prompt(prompt: str, use_cache: bool = False) -> EncyclopediaResponse:
+    """
+    Answer one session-less prompt of a batch on the calling worker thread's own agent.
+    """
+    if not hasattr(_batch_agents, 'agent'):
+        _batch_agents.agent = build_encyclopedia_agent()
+    return answer_prompt(prompt, _batch_agents.agent, use_cache=use_cache)
+
+def _batch_deadline(context) -> float:
+    """
+    Return the monotonic time after which no further batched prompt is started.
+    """
+    if context is None:
+        return float('inf')
+    return time.monotonic() + (context.get_remaining_time_in_millis() - batch_prompt_budget_ms) / 1000
+
+def _answer_before(deadline: float, answer: Callable[[str], EncyclopediaResponse], prompt: str) -> Optional[EncyclopediaResponse]:
+    """
+    Answer a batched prompt, or return None without running it once the deadline has passed.
+    """
+    return answer(prompt) if time.monotonic() < deadline else None
+
+# Direct retrieval never uses the agent, so there is nothing to warm up
+initialize_container(None if direct_retrieval else get_encyclopedia_agent)
+
+def answer_prompt(
+    prompt: str,
+    encyclopedia_agent: Optional[Any] = None,
+    session_id: Optional[str] = None,
+    use_cache: bool = False,
+) -> EncyclopediaResponse:
+    """
+    Run a single prompt through an encyclopedia agent (the shared one by default) and collect its citations.
+
+    session_id is the request's Bedrock RAG session. It is returned unchanged when the agent
+    answers without a successful retrieval, so the client keeps its conversation.
+
+    With use_cache, the answer is read from and stored in the response cache. Like retrieval
+    cache hits, cached answers have no sessionId.
+    """
+    if use_cache:
+        cache_key = (knowledge_base_id, text_hash(prompt))
+        cached = _response_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, 'citations': copy_citations(cached['citations']), 'sessionId': None}
+    
+    if encyclopedia_agent is None:
+        encyclopedia_agent = get_encyclopedia_agent()
+    
+    # The agent's conversation and metrics are scoped to this prompt: they are reset even
+    # if the agent raises, so no state leaks into the next prompt on this agent
+    try:
+        response_text = str(encyclopedia_agent(prompt))
+        
+        # Print a bounded preview of the response to Lambda logs
+        print(f"Encyclopedia agent response ({len(response_text)} chars): {response_text[:200]}")
+        
+        # Get citations and sessionId from the custom_retrieve results of this conversation
+        raw_citations, new_session_id, retrieval_failed = extract_retrieval_results(encyclopedia_agent.messages)
+    finally:
+        reset_agent(encyclopedia_agent)
+        
+    # The raw citation dicts already match the Citation schema, so they are returned as-is
+    api_response = {
+        'response': response_text,
+        'citations': raw_citations,
+        'sessionId': new_session_id or session_id
+    }
+    
+    # An answer written after a failed retrieval (e.g. a throttled Bedrock call) must not
+    # be served from the cache for the rest of the TTL
+    if use_cache and (raw_citations or not retrieval_failed):
+        _response_cache.set(cache_key, {**api_response, 'citations': copy_citations(raw_citations)})
+    
+    return api_response
+
+def answer_prompt_direct(prompt: str, knowledge_base_id: str, session_id: Optional[str] = None) -> EncyclopediaResponse:
+    """
+    Answer a single prompt straight from the knowledge base, without the agent.
+    """
+    answer_text, citations, new_session_id = retrieve_and_generate_answer(
+        prompt,
+        knowledge_base_id=knowledge_base_id,
+        session_id=session_id,
+        guardrail_id=guardrail_id,
+    )
+    
+    return {
+        'response': answer_text,
+        'citations': citations,
+        'sessionId': new_session_id or session_id
+    }
+
+def handler(event: Dict[str, Any], context) -> Dict[str, Any]:
+    # Scheduled warmup pings only need the initialized container, not an agent run
+    if event.get('warmup'):
+        return proxy_response(200, {'warmup': True}, RESPONSE_HEADERS)
+    
     try:
         # Parse the request body from API Gateway
         try:
             if 'body' in event:
-                body = json.loads(event['body'])
-                # Validate request with Pydantic
-                request = EncyclopediaRequest(**body)
-                prompt = request.prompt
-                session_id = request.sessionId
+                # Parse and validate the raw body in one pass in pydantic's Rust core
+                request = EncyclopediaRequest.model_validate_json(event['body'])
             else:
                 # Direct Lambda invocation
                 # Validate request with Pydantic
-                request = EncyclopediaRequest(**event)
-                prompt = request.prompt
-                session_id = request.sessionId
-        except Exception as e:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-                    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS'
-                },
-                'body': json.dumps({'error': f'Error parsing request: {str(e)}'})
-            }
-        
-        if not prompt:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'error': 'Missing prompt parameter'})
-            }
-        
-        # Get knowledge base ID from environment
-        knowledge_base_id = os.environ.get('KNOWLEDGE_BASE_ID')
-        if not knowledge_base_id:
-            return {
-                'statusCode': 500,
-                'body': json.dumps({'error': 'Knowledge base ID not configured'})
-            }
+                request = EncyclopediaRequest.model_validate(event)
+        except ValidationError as e:
+            # Raised for both malformed JSON and fields of the wrong type
+            return proxy_response(400, {'error': f'Error parsing request: {str(e)}'}, RESPONSE_HEADERS)
         
-        # Set knowledge base ID as environment variable for retrieve tool
-        os.environ["KNOWLEDGE_BASE_ID"] = knowledge_base_id
+        prompt = request.prompt
+        session_id = request.sessionId
         
-        # Set model ID for retrieve_and_generate
-        os.environ["MODEL_ID"] = "anthropic.claude-3-sonnet-20240229-v1:0"
+        if not prompt and not request.prompts:
+            return proxy_response(400, {'error': 'Missing prompt parameter'}, RESPONSE_HEADERS)
         
-        # Set sessionId if provided
-        if session_id:
-            os.environ["SESSION_ID"] = session_id
+        if not knowledge_base_id:
+            return proxy_response(500, {'error': 'Knowledge base ID not configured'}, RESPONSE_HEADERS)
         
-        # Get guardrail ID from environment (optional)
-        guardrail_id = os.environ.get('GUARDRAIL_ID')
+        # Pass the request's sessionId (or none) to the retrieve tool
+        set_session_id(session_id)
         
-        # Create model with guardrail if available
-        if guardrail_id:
-            model = BedrockModel(
-                model_id="anthropic.claude-3-sonnet-20240229-v1:0",
-                guardrail_id=guardrail_id,
-                guardrail_version="DRAFT",  # or "LATEST" for deployed version
-                guardrail_trace="enabled"  # Enable trace info for debugging
-            )
+        if direct_retrieval:
+            # Direct answers are already cached by the retrieval cache in custom_tools
+            answer = batch_answer = partial(answer_prompt_direct, knowledge_base_id=knowledge_base_id, session_id=session_id)
         else:
-            model = BedrockModel(
-                model_id="anthropic.claude-3-sonnet-20240229-v1:0"
-            )
-        
-        # Create encyclopedia agent with custom retrieve tool and guardrailed model
-        encyclopedia_agent = Agent(
-            model=model,
-            system_prompt=ENCYCLOPEDIA_SYSTEM_PROMPT,
-            tools=[custom_retrieve],
-        )
-
-        response = encyclopedia_agent(prompt)
+            # Session-less prompts are answered from the response cache when possible
+            use_cache = not session_id and not request.nocache
+            answer = partial(answer_prompt, session_id=session_id, use_cache=use_cache)
+            batch_answer = partial(_answer_batch_prompt, use_cache=use_cache)
         
-        # Print response to Lambda logs
-        print(f"Encyclopedia agent response: {response}")
-        
-        # Get citations and sessionId from custom_retrieve tool if available
-        try:
-            raw_citations = custom_retrieve.last_citations
-            new_session_id = custom_retrieve.last_session_id
-        except AttributeError:
-            # If attributes don't exist yet
-            raw_citations = []
-            new_session_id = None
+        # A batch of prompts is answered within a single invocation. Independent prompts run
+        # concurrently; prompts that continue a session run in order so each one sees the
+        # previous turns. Prompts start in order, so the ones skipped at the deadline are
+        # the tail of the batch and are returned as unanswered.
+        if request.prompts:
+            deadline = _batch_deadline(context)
+            if session_id:
+                results = map(partial(_answer_before, deadline, answer), request.prompts)
+            else:
+                results = _batch_executor.map(partial(_answer_before, deadline, batch_answer), request.prompts)
             
-        # Convert raw citations to Pydantic models
-        citations = []
-        for raw_citation in raw_citations:
-            # Convert span dict to Span model if it exists
-            span = None
-            if raw_citation.get('span'):
-                span = Span(**raw_citation['span'])
-                
-            citation = Citation(
-                id=raw_citation['id'],
-                source=raw_citation['source'],
-                content=raw_citation['content'],
-                metadata=raw_citation['metadata'],
-                span=span
-            )
-            citations.append(citation)
-        
-        # Create response model
-        api_response = EncyclopediaResponse(
-            response=str(response),
-            citations=citations,
-            sessionId=new_session_id
-        )
+            responses = list(takewhile(lambda result: result is not None, results))
+            api_response = {'responses': responses}
+            if len(responses) < len(request.prompts):
+                api_response['unanswered'] = request.prompts[len(responses):]
+        else:
+            api_response = answer(prompt)
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-                'Access-Control-Allow-Methods': 'GET,POST,OPTIONS'
-            },
-            'body': api_response.model_dump_json()
-        }
+        return proxy_response(200, api_response, RESPONSE_HEADERS)
         
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-                'Access-Control-Allow-Methods': 'GET,POST,OPTIONS'
-            },
-            'body': json.dumps({'error': str(e)})
-        }
\ No newline at end of file
+        return proxy_response(500, {'error': str(e)}, RESPONSE_HEADERS)
+    
+    finally:
+        # Don't carry this request's sessionId over to the next invocation
+        set_session_id(None)
\ No newline at end of file
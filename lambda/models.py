@@ -1,30 +1,40 @@
-from typing import Dict, List, Optional, Any
+from typing import Annotated, Dict, List, Optional, Any, TypedDict
 from pydantic import BaseModel, Field
 
+# Largest batch accepted in one request. Every prompt is a full agent run inside the
+# Lambda timeout, so larger batches are rejected with a 400.
+MAX_BATCH_PROMPTS = 10
 
-class Span(BaseModel):
+# A batched prompt; empty prompts are rejected with a 400
+BatchPrompt = Annotated[str, Field(min_length=1)]
+
+
+class Span(TypedDict):
     """Model for text span information."""
     start: int
     end: int
 
 
-class Citation(BaseModel):
+class Citation(TypedDict):
     """Model for citation information."""
     id: str
     source: str
     content: str
     metadata: Dict[str, Any]
-    span: Optional[Span] = None
+    span: Optional[Span]
 
 
 class EncyclopediaRequest(BaseModel):
-    """Model for encyclopedia API request."""
-    prompt: str
+    """Model for encyclopedia API request. Either a single prompt or a batch of prompts."""
+    prompt: Optional[str] = None
+    prompts: Optional[List[BatchPrompt]] = Field(default=None, max_length=MAX_BATCH_PROMPTS)
     sessionId: Optional[str] = None
+    nocache: bool = False  # Skip the warm-container response cache
 
 
-class EncyclopediaResponse(BaseModel):
+class EncyclopediaResponse(TypedDict):
     """Model for encyclopedia API response."""
     response: str
-    citations: List[Citation] = []
-    sessionId: Optional[str] = None
\ No newline at end of file
+    citations: List[Citation]
+    sessionId: Optional[str]
+
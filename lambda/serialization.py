@@ -0,0 +1,40 @@
+import logging
+from typing import Any, Callable, Dict, Optional
+
+# Prefer orjson for request/response bodies; fall back to the standard library
+# if it is missing from the dependencies layer.
+try:
+    import orjson
+
+    loads = orjson.loads
+
+    def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> str:
+        """
+        Serialize obj to a JSON string (API Gateway bodies must be str, not bytes).
+        """
+        return orjson.dumps(obj, default=default).decode()
+
+except ImportError:
+    import json
+
+    # Logged once per container so a layer without orjson is visible in the logs
+    logging.getLogger(__name__).warning("orjson is not installed; using the standard json module")
+
+    loads = json.loads
+
+    def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> str:
+        """
+        Serialize obj to a JSON string (API Gateway bodies must be str, not bytes).
+        """
+        return json.dumps(obj, default=default)
+
+
+def proxy_response(status_code: int, payload: Any, headers: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Build an API Gateway proxy response with the given headers and a JSON body.
+    """
+    return {
+        'statusCode': status_code,
+        'headers': headers,
+        'body': dumps(payload)
+    }
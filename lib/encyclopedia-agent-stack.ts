@@ -3,6 +3,8 @@ import { Construct } from "constructs";
 import * as lambda from "aws-cdk-lib/aws-lambda";
 import * as iam from "aws-cdk-lib/aws-iam";
 import * as apigateway from "aws-cdk-lib/aws-apigateway";
+import * as events from "aws-cdk-lib/aws-events";
+import * as targets from "aws-cdk-lib/aws-events-targets";
 import * as path from "path";
 
 export interface EncyclopediaAgentStackProps extends StackProps {
@@ -38,6 +40,8 @@ export class EncyclopediaAgentStack extends Stack {
       memorySize: 256,
       layers: [dependenciesLayer],
       architecture: lambda.Architecture.ARM_64,
+      // Snapshot the initialized environment (including the pre-built agent) on each published version
+      snapStart: lambda.SnapStartConf.ON_PUBLISHED_VERSIONS,
       environment: {
         KNOWLEDGE_BASE_ID: props.knowledgeBaseId,
         ...(props.guardrailId && { GUARDRAIL_ID: props.guardrailId }),
@@ -58,6 +62,23 @@ export class EncyclopediaAgentStack extends Stack {
       }),
     );
 
+    // SnapStart only applies to published versions, so traffic goes through an alias
+    const encyclopediaAlias = new lambda.Alias(this, "EncyclopediaLambdaLive", {
+      aliasName: "live",
+      version: encyclopediaFunction.currentVersion,
+    });
+
+    // Keep an execution environment warm; the handler returns immediately for warmup events
+    new events.Rule(this, "EncyclopediaWarmupRule", {
+      description: "Keeps the encyclopedia Lambda warm",
+      schedule: events.Schedule.rate(Duration.minutes(5)),
+      targets: [
+        new targets.LambdaFunction(encyclopediaAlias, {
+          event: events.RuleTargetInput.fromObject({ warmup: true }),
+        }),
+      ],
+    });
+
     // Create API Gateway with CORS enabled
     const encyclopediaApi = new apigateway.RestApi(this, "EncyclopediaApi", {
       restApiName: "Encyclopedia Chat API",
@@ -71,7 +92,7 @@ export class EncyclopediaAgentStack extends Stack {
     });
 
     // Create Lambda integration
-    const lambdaIntegration = new apigateway.LambdaIntegration(encyclopediaFunction);
+    const lambdaIntegration = new apigateway.LambdaIntegration(encyclopediaAlias);
 
     // Add /kb resource with POST method
     const kbResource = encyclopediaApi.root.addResource("kb");